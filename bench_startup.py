@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Startup benchmark for XML to DDL converter
+# Runs xml2ddl.py with --help and as a cache hit. Modules imported on top of
+# bare interpreter startup are collected by "python -X importtime" and wall
+# clock time is compared with "python -c pass", so the cost of compiling the
+# script is measured as well. Fails if a module, which should be imported
+# lazily, is loaded or if the import or wall clock time exceeds given budget.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Modules which must not be imported when printing help.
+LAZY_MODULES = ("re", "getopt", "gettext", "hashlib",
+                "xml.etree.ElementTree", "xml.parsers.expat")
+
+# Modules needed to compute cache key.
+CACHE_MODULES = ("hashlib",)
+
+# Path to the converter.
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "xml2ddl.py")
+
+# Small input for cache hit.
+INPUT = "<root><item id=\"1\"><sub>text</sub></item></root>\n"
+
+################################################################################
+# Run python with -X importtime and collect imported modules.
+# @param - arguments passed to python
+# @return - dict with module name as a key and cumulative time in us as a value
+def import_times(args):
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(fields[1])
+        except ValueError:
+            continue    # Header line.
+        times[fields[2].strip()] = cumulative
+
+    return times
+
+################################################################################
+# Measure import time of given converter invocation.
+# @param - arguments passed to the converter
+# @param - number of runs, the best one is reported
+# @return - dict with modules imported by the converter and their time in us
+def measure(args, runs):
+    best = None
+    for num in range(runs):
+        base = import_times(["-c", "pass"])
+        times = import_times([SCRIPT] + args)
+        extra = dict((name, time) for name, time in times.items()
+                     if name not in base)
+        if best is None or sum(extra.values()) < sum(best.values()):
+            best = extra
+
+    return best
+
+################################################################################
+# Measure wall clock time of the converter over "python -c pass". Both are run
+# in turns, so load of the machine affects them the same way.
+# @param - arguments passed to the converter
+# @param - number of runs, the best one is reported
+# @return - time in ms
+def wall_time(args, runs):
+    best = {}
+    for num in range(runs):
+        for name, cmd in (("base", ["-c", "pass"]), ("script", [SCRIPT] + args)):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + cmd, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            best[name] = min(best.get(name, elapsed), elapsed)
+
+    return best["script"] - best["base"]
+
+################################################################################
+# Measure one converter invocation and check it against budgets.
+# @param - name of the invocation
+# @param - arguments passed to the converter
+# @param - modules which must not be imported
+# @param - number of runs
+# @return - 1 if budget was exceeded, otherwise 0
+def check(name, args, lazy, runs):
+    import_budget = int(os.environ.get("XTD_IMPORT_BUDGET_US", "15000"))
+    wall_budget = float(os.environ.get("XTD_STARTUP_BUDGET_MS", "25"))
+
+    print(name + ":")
+    extra = measure(args, runs)
+    total = sum(extra.values())
+    for module, time in sorted(extra.items(), key=lambda item: -item[1]):
+        print("%10d us  %s" % (time, module))
+    print("%10d us  imports (budget %d us)" % (total, import_budget))
+
+    overhead = wall_time(args, runs)
+    print("%10.1f ms  over python -c pass (budget %.1f ms)"
+          % (overhead, wall_budget))
+
+    failed = 0
+    for module in lazy:
+        if module in extra:
+            print("Module " + module + " imported on " + name + "!",
+                  file=sys.stderr)
+            failed = 1
+
+    if total > import_budget:
+        print("Import time of " + name + " over budget!", file=sys.stderr)
+        failed = 1
+
+    if overhead > wall_budget:
+        print("Startup time of " + name + " over budget!", file=sys.stderr)
+        failed = 1
+
+    return failed
+
+################################################################################
+# Main function. Measure startup and check budget.
+# @param - none
+# @return - exit code
+def main():
+    runs = int(os.environ.get("XTD_IMPORT_RUNS", "10"))
+
+    failed = check("--help", ["--help"], LAZY_MODULES, runs)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        fname = os.path.join(tmpdir, "input.xml")
+        with open(fname, "w") as fin:
+            fin.write(INPUT)
+        args = ["--input=" + fname, "--cache=" + os.path.join(tmpdir, "cache")]
+
+        # Fill the cache first.
+        subprocess.run([sys.executable, SCRIPT] + args,
+                       stdout=subprocess.DEVNULL)
+
+        lazy = [module for module in LAZY_MODULES
+                if module not in CACHE_MODULES]
+        failed |= check("cache hit", args, lazy, runs)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return failed
+
+################################################################################
+
+if __name__ == '__main__':
+    sys.exit(main())
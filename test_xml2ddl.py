@@ -0,0 +1,560 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Tests for XML to DDL converter
+# Run by "python -m pytest" or "python -m unittest".
+
+import getopt
+import io
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+import xml2ddl
+
+################################################################################
+# Update database structure the way Database.flush() did before it was made
+# incremental: relations are rebuilt from scratch from all tables.
+# @param - database to flush
+# @param - etc option
+# @param - enable duplicit tables
+# @return - dict with table name as a key and set of related tables as a value
+def reference_flush(db, etc, duplicity):
+    entries = db.entries()
+    relations = {}
+
+    for table in entries.values():
+        relations[table.name()] = set([])
+
+    for table in list(entries.values()):
+        for name, count in table.relations().items():
+            if duplicity:
+                if name in table.columns().keys():
+                    raise xml2ddl.XTDNameError
+                table.set_key(name)
+                relations[table.name()].add(name)
+
+            elif etc != -1 and count > etc:
+                if name not in entries:
+                    entries[name] = xml2ddl.Table(name)
+                    relations[name] = set([])
+                if name in entries[name].columns().keys():
+                    raise xml2ddl.XTDNameError
+                entries[name].set_key(table.name())
+                relations[name].add(table.name())
+
+            else:
+                if count == 1:
+                    if name in table.columns().keys():
+                        raise xml2ddl.XTDNameError
+                    table.set_key(name)
+                else:
+                    for num in range(count):
+                        if (name + str(num + 1)) in table.columns().keys():
+                            raise xml2ddl.XTDNameError
+                        table.set_key(name + str(num + 1))
+                relations[table.name()].add(name)
+
+    return relations
+
+################################################################################
+class FlushTest(unittest.TestCase):
+    """Incremental Database.flush() gives the same result as full rebuild."""
+
+    TABLES = "abcd"
+    COLUMNS = ("a", "b", "b1", "b2_id", "c3", "d10", "x")
+
+    # Flush both databases and check they are the same.
+    # @param - incrementally flushed database
+    # @param - database flushed by reference_flush()
+    # @param - etc option
+    # @param - enable duplicit tables
+    # @return - True if there was a name collision
+    def check_flush(self, db, ref, etc, duplicity):
+        try:
+            db.flush()
+            collision = False
+        except xml2ddl.XTDNameError:
+            collision = True
+
+        try:
+            expected = reference_flush(ref, etc, duplicity)
+        except xml2ddl.XTDNameError:
+            self.assertTrue(collision)
+            return True
+
+        self.assertFalse(collision)
+        # Relations are private, there is no getter for them.
+        self.assertEqual(db._Database__relations, expected)
+
+        # Tables, keys and columns printed by print_ddl().
+        self.assertEqual(list(db.entries()), list(ref.entries()))
+        for name in db.entries():
+            self.assertEqual(list(db.keys(name)), list(ref.keys(name)))
+            self.assertEqual(db.columns(name), ref.columns(name))
+
+        return False
+
+    # Apply random updates to two databases, flushing both at the same points.
+    # @param - random generator
+    # @return - none
+    def run_sequence(self, rnd):
+        etc = rnd.choice([-1, 1, 2])
+        duplicity = etc == -1 and rnd.random() < 0.3
+        db = xml2ddl.Database(etc = etc, duplicity = duplicity)
+        ref = xml2ddl.Database(etc = etc, duplicity = duplicity)
+
+        for num in range(30):
+            name = rnd.choice(self.TABLES)
+            if rnd.random() < 0.6:
+                relations = {rnd.choice(self.TABLES): rnd.randint(1, 4)}
+                db.update_relations(name, relations)
+                ref.update_relations(name, relations)
+            else:
+                column = rnd.choice(self.COLUMNS)
+                db.update_attribute(name, column, "1")
+                ref.update_attribute(name, column, "1")
+
+            if rnd.random() < 0.2:
+                if self.check_flush(db, ref, etc, duplicity):
+                    return
+
+        self.check_flush(db, ref, etc, duplicity)
+
+    def test_random_sequences(self):
+        rnd = random.Random(28)
+        for num in range(3000):
+            self.run_sequence(rnd)
+
+    def test_numbered_key_collision(self):
+        for column in ("b2", "b2_id", "b3"):
+            db = xml2ddl.Database()
+            db.update_attribute("a", column, "x")
+            db.update_relations("a", {"b": 3})
+            self.assertRaises(xml2ddl.XTDNameError, db.flush)
+
+        for column in ("b4", "b03", "b0_id", "b10"):
+            db = xml2ddl.Database()
+            db.update_attribute("a", column, "x")
+            db.update_relations("a", {"b": 3})
+            db.flush()
+            self.assertEqual(list(db.keys("a")), ["b1_id", "b2_id", "b3_id"])
+
+################################################################################
+class BatchDataTypeTest(unittest.TestCase):
+    """Batched data types are the same as data types of values one by one."""
+
+    VALUES = ("1", "0", "True", "False", "", "12", "007", "-3.5e2", "1.5",
+              ".5", "5.", "1e5", "+1", "abc", "true", " 7", "1 ", "\n",
+              "1\n", "12\n", "1.5\n", "1\n\n", "x\n", "\u0663",
+              "\u0663.\u0665", "1\x00")
+
+    TYPES = ("BIT", "INT", "FLOAT", "NVARCHAR", "NTEXT")
+
+    def test_random_batches(self):
+        rnd = random.Random(31)
+        for num in range(5000):
+            data = [rnd.choice(self.VALUES) for item in range(rnd.randint(0, 12))]
+            for value in (0, 1):
+                for data_type in self.TYPES:
+                    expected = data_type
+                    for item in data:
+                        expected = xml2ddl.get_data_type(item, expected, value)
+
+                    self.assertEqual(xml2ddl.get_batch_data_type(data,
+                                                                 data_type,
+                                                                 value),
+                                     expected)
+
+    def test_table(self):
+        rnd = random.Random(310)
+        for num in range(20):
+            table = xml2ddl.Table("t")
+            expected = {}
+            value = None
+            for item in range(rnd.randint(1, 3 * xml2ddl.VALUE_BATCH)):
+                column = rnd.choice(("a", "a", "b", "value"))
+                data = rnd.choice(self.VALUES)
+                table.update_attribute(column, data)
+
+                if column == "value":
+                    value = xml2ddl.get_data_type(data, "BIT", 1)
+                else:
+                    expected[column] = xml2ddl.get_data_type(data,
+                                                expected.get(column, "BIT"))
+
+                # Read data types in the middle of a batch now and then.
+                if rnd.random() < 0.01:
+                    self.assertEqual(table.columns(), expected)
+                    self.assertEqual(table.value(), value)
+
+            self.assertEqual(list(table.columns()), list(expected))
+            self.assertEqual(table.columns(), expected)
+            self.assertEqual(table.value(), value)
+
+################################################################################
+class LimitTest(unittest.TestCase):
+    """Limits abort conversion and progress is reported while parsing."""
+
+    # Build database from given document.
+    # @param - document as bytes
+    # @param - database to build
+    # @param - monitor to use, if any
+    # @return - none
+    def build(self, document, db, monitor = None):
+        xml2ddl.xtd_database(io.BytesIO(document), db, monitor)
+
+    def test_max_tables(self):
+        document = b"<root><a><b/></a><c/><a/></root>"
+        self.build(document, xml2ddl.Database(max_tables = 3))
+
+        with self.assertRaises(xml2ddl.XTDLimitError) as context:
+            self.build(document, xml2ddl.Database(max_tables = 2))
+        self.assertEqual(str(context.exception),
+                         "Number of tables exceeds 2!")
+
+    def test_max_depth(self):
+        document = b"<root><a><b><c/></b></a><a/></root>"
+        self.build(document, xml2ddl.Database(), xml2ddl.Monitor(max_depth = 3))
+
+        with self.assertRaises(xml2ddl.XTDLimitError) as context:
+            self.build(document, xml2ddl.Database(),
+                       xml2ddl.Monitor(max_depth = 2))
+        self.assertEqual(str(context.exception), "Nesting depth exceeds 2!")
+
+    def test_max_rss(self):
+        try:
+            import resource
+        except ImportError:
+            self.skipTest("--max-rss is not supported on this platform")
+
+        monitor = xml2ddl.Monitor(max_rss = 1)
+        with self.assertRaises(xml2ddl.XTDLimitError) as context:
+            self.build(b"<root><a/></root>", xml2ddl.Database(), monitor)
+        self.assertEqual(str(context.exception),
+                         "Resident set size exceeds 1 MB!")
+
+    def test_exit_code(self):
+        fd, fname = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as fin:
+                fin.write(b"<root><a/><b/></root>")
+
+            with unittest.mock.patch("sys.argv", ["xml2ddl.py", "--no-cache",
+                                                  "--input=" + fname,
+                                                  "--max-tables=1"]), \
+                 unittest.mock.patch("sys.stdout", new = io.StringIO()), \
+                 unittest.mock.patch("sys.stderr", new = io.StringIO()) \
+                    as stderr:
+                with self.assertRaises(SystemExit) as context:
+                    xml2ddl.main()
+        finally:
+            os.remove(fname)
+
+        self.assertEqual(context.exception.code, 92)
+        self.assertEqual(stderr.getvalue(), "Number of tables exceeds 1!\n")
+
+    def test_report(self):
+        # Document of 1.5 MB with 2 tables, 3 columns and 20000 elements.
+        document = b"<root>" + b"<a x=\"1\" y=\"2\"><b z=\"3\"/></a>" * 10000
+        document += b" " * (1536 * 1024 - len(document) - 7) + b"</root>"
+
+        # Every check of the clock is 10 seconds after the previous one.
+        clock = iter(range(0, 1000000, 10))
+        fout = io.StringIO()
+        with unittest.mock.patch("time.time", lambda: next(clock)):
+            monitor = xml2ddl.Monitor(interval = 1, fout = fout)
+        db = xml2ddl.Database()
+        self.build(document, db, monitor)
+        monitor.report(db)
+
+        lines = fout.getvalue().splitlines()
+        # Progress is reported while the document is parsed, not only at end.
+        self.assertGreater(len(lines), 10)
+        self.assertTrue(lines[0].startswith("xml2ddl: 0.1 MB read, "))
+        self.assertTrue(lines[-1].startswith("xml2ddl: 1.5 MB read, "
+                                             "20000 elements, 2 tables, "
+                                             "3 columns, "), lines[-1])
+
+        # No reports without interval.
+        fout = io.StringIO()
+        monitor = xml2ddl.Monitor(fout = fout)
+        self.build(document, xml2ddl.Database(), monitor)
+        monitor.report(db)
+        self.assertEqual(fout.getvalue(), "")
+
+################################################################################
+class DialectTest(unittest.TestCase):
+    """DDL is printed in every SQL dialect."""
+
+    DDL = ("CREATE TABLE item(\n"
+           "   prk_item_id {INT} PRIMARY KEY,\n"
+           "   sub_id {INT},\n"
+           "   flag {BIT},\n"
+           "   num {INT},\n"
+           "   real {FLOAT},\n"
+           "   name {NVARCHAR},\n"
+           "   value {NTEXT}\n"
+           ");\n"
+           "\n"
+           "CREATE TABLE sub(\n"
+           "   prk_sub_id {INT} PRIMARY KEY,\n"
+           "   x {BIT}\n"
+           ");\n"
+           "\n")
+
+    # Data types of each dialect in order BIT, INT, FLOAT, NVARCHAR, NTEXT.
+    TYPES = {
+        "mssql":      ("BIT", "INT", "FLOAT", "NVARCHAR", "NTEXT"),
+        "postgresql": ("BOOLEAN", "INTEGER", "DOUBLE PRECISION", "VARCHAR",
+                       "TEXT"),
+        "sqlite":     ("INTEGER", "INTEGER", "REAL", "TEXT", "TEXT"),
+        "mysql":      ("BIT", "INT", "DOUBLE", "TEXT", "LONGTEXT"),
+    }
+
+    # Expected DDL in given dialect.
+    # @param - name of the dialect
+    # @return - DDL as a string
+    def expected(self, dialect):
+        return self.DDL.format(**dict(zip(("BIT", "INT", "FLOAT", "NVARCHAR",
+                                           "NTEXT"), self.TYPES[dialect])))
+
+    # Parse cmd-line arguments.
+    # @param - arguments without program name
+    # @return - cmd-line parameters as a dict
+    def check_opt(self, args):
+        with unittest.mock.patch("sys.argv", ["xml2ddl.py"] + args):
+            return xml2ddl.check_opt()
+
+    def test_print_ddl(self):
+        db = xml2ddl.Database()
+        for column, data in (("flag", "1"), ("num", "12"), ("real", "1.5"),
+                             ("name", "abc")):
+            db.update_attribute("item", column, data)
+        db.update_value("item", "long text")
+        db.update_relations("item", {"sub": 1})
+        db.update_attribute("sub", "x", "0")
+
+        self.assertEqual(sorted(xml2ddl.DIALECTS), sorted(self.TYPES))
+        for dialect in self.TYPES:
+            out = io.StringIO()
+            db.print_ddl(out, dialect)
+            self.assertEqual(out.getvalue(), self.expected(dialect))
+
+    def test_xtd(self):
+        param = self.check_opt(["--no-cache", "--dialect=sqlite",
+                                "--dialect=mysql=out.sql"])
+        fout = io.StringIO()
+        fdialect = io.StringIO()
+        xml2ddl.xtd(io.BytesIO(b"<root><sub x=\"0\"/></root>"), fout, {},
+                    param, [("mysql", fdialect)])
+
+        self.assertEqual(fout.getvalue(), "CREATE TABLE sub(\n"
+                                          "   prk_sub_id INTEGER PRIMARY KEY,\n"
+                                          "   x INTEGER\n"
+                                          ");\n\n")
+        self.assertEqual(fdialect.getvalue(), "CREATE TABLE sub(\n"
+                                              "   prk_sub_id INT PRIMARY KEY,\n"
+                                              "   x BIT\n"
+                                              ");\n\n")
+
+    def test_options(self):
+        self.assertEqual(self.check_opt(["-g", "--dialect=sqlite=out.sql"]),
+                         {"g": "g", "dialect": {"sqlite": "out.sql"}})
+
+        for args, message in (
+                (["-g", "--dialect=sqlite"],
+                 "-g and --dialect without file not allowed at the same time!"),
+                (["--dialect=sqlite", "--dialect=sqlite=out.sql"],
+                 "Duplicit dialect sqlite!"),
+                (["--dialect=sqlite=a.sql", "--dialect=sqlite=b.sql"],
+                 "Duplicit dialect sqlite!"),
+                (["--dialect=sqlite", "--dialect=mysql"],
+                 "Only one --dialect without file allowed!"),
+                (["--dialect=oracle"], "Unknown dialect oracle!"),
+                (["--dialect=sqlite="], "Missing file for dialect sqlite!")):
+            with self.assertRaises(xml2ddl.XTDCheckArgument) as context:
+                self.check_opt(args)
+            self.assertEqual(str(context.exception), message)
+
+################################################################################
+class ParseOptTest(unittest.TestCase):
+    """Arguments are split to options the same way getopt.getopt() does."""
+
+    # Option help is a prefix of helpers as cache= is a prefix of cache-size=.
+    SHORTOPTS = "abgo:"
+    LONGOPTS = ["help", "helpers", "input=", "isvalid=", "cache=",
+                "cache-size=", "no-cache"]
+
+    ARGS = (
+        [], ["file"], ["-"], ["-a", "-"], ["-a", "file", "-b"],
+        # Short options.
+        ["-a", "-b", "-g"], ["-ab"], ["-ofile"], ["-o", "file"],
+        ["-abofile", "rest"], ["-o", "-a"], ["-o", ""],
+        # Long options and unique prefixes.
+        ["--help"], ["--helper"], ["--input=x"], ["--in=x"], ["--input", "x"],
+        ["--input="], ["--input", "--help"], ["--input=a=b"], ["--cache=d"],
+        ["--cache", "d"], ["--cache-s=1"], ["--no"], ["--help", "--no-cache"],
+        # End of options.
+        ["--", "-a"], ["-a", "--", "--help"], ["--"], ["-a", "--", "--"],
+        # Errors.
+        ["--foo"], ["--he"], ["--i=x"], ["--c=d"], ["--=x"], ["--input"], ["--in"],
+        ["--help=x"], ["--no=x"], ["-x"], ["-ax"], ["-:"], ["-o"], ["-abo"],
+        ["-a", "--foo", "-x"],
+    )
+
+    def test_getopt(self):
+        for args in self.ARGS:
+            try:
+                expected = getopt.getopt(args, self.SHORTOPTS, self.LONGOPTS)
+            except getopt.GetoptError as err:
+                with self.assertRaises(xml2ddl.XTDCheckArgument,
+                                       msg = repr(args)) as context:
+                    xml2ddl.parse_opt(args, self.SHORTOPTS, self.LONGOPTS)
+                self.assertEqual(str(context.exception), err.msg, repr(args))
+            else:
+                self.assertEqual(xml2ddl.parse_opt(args, self.SHORTOPTS,
+                                                   self.LONGOPTS),
+                                 expected, repr(args))
+
+    def test_messages(self):
+        for args, message in (
+                (["--foo"], "option --foo not recognized"),
+                (["--c=d"], "option --c not a unique prefix"),
+                (["--input"], "option --input requires argument"),
+                (["--help=x"], "option --help must not have an argument"),
+                (["-x"], "option -x not recognized"),
+                (["-o"], "option -o requires argument")):
+            with self.assertRaises(xml2ddl.XTDCheckArgument) as context:
+                xml2ddl.parse_opt(args, self.SHORTOPTS, self.LONGOPTS)
+            self.assertEqual(str(context.exception), message)
+
+################################################################################
+class CacheTest(unittest.TestCase):
+    """Results are stored in cache directory and evicted from it."""
+
+    INPUT = b"<root><item id=\"1\"><sub>text</sub></item><item/></root>"
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    # Run conversion with given parameters.
+    # @param - cmd-line parameters as a dict
+    # @return - output as a string
+    def run_xtd(self, param):
+        fout = io.StringIO()
+        xml2ddl.xtd(io.BytesIO(self.INPUT), fout, {}, param)
+        return fout.getvalue()
+
+    def test_digest(self):
+        cache = xml2ddl.Cache(self.path)
+        fin = io.BytesIO(b"skipped" + self.INPUT)
+        fin.seek(len(b"skipped"))
+        digest, fread = cache.digest(fin)
+        self.assertIs(fread, fin)
+        self.assertEqual(fin.tell(), len(b"skipped"))
+
+        # Input which can not be rewound is copied.
+        fpipe = io.BufferedReader(io.BytesIO(self.INPUT))
+        fpipe.seekable = lambda: False
+        digest2, fread = cache.digest(fpipe)
+        self.assertEqual(digest2, digest)
+        self.assertEqual(fread.read(), self.INPUT)
+
+    def test_key(self):
+        cache = xml2ddl.Cache(self.path)
+        digests = [cache.digest(io.BytesIO(self.INPUT))[0]]
+        base = {"dialect": "mssql"}
+        key = cache.key(digests, base)
+        self.assertEqual(cache.key(digests, dict(base)), key)
+        self.assertTrue(cache.is_key(key))
+
+        keys = set([key])
+        for param in ({"etc": 1}, {"etc": 2}, {"a": "a"}, {"b": "b"},
+                      {"g": "g"}, {"header": "x"}, {"header": "y"},
+                      {"dialect": "sqlite"}, {"dialect": None},
+                      {"output": "x", "progress": 1, "no-cache": "no-cache"}):
+            keys.add(cache.key(digests, dict(base, **param)))
+        # Parameters, which do not change output, do not change key.
+        self.assertEqual(len(keys), 10)
+
+        # Content of file to validate against is part of the key.
+        for content in (b"<root/>", b"<root><item/></root>"):
+            digest = cache.digest(io.BytesIO(content))[0]
+            keys.add(cache.key(digests + [digest], base))
+        self.assertEqual(len(keys), 12)
+
+    def test_hit(self):
+        param = {"cache": self.path}
+        output = self.run_xtd(param)
+        self.assertEqual(self.run_xtd({"no-cache": "no-cache"}), output)
+
+        with unittest.mock.patch.object(xml2ddl, "xtd_database",
+                                        side_effect = AssertionError):
+            self.assertEqual(self.run_xtd(param), output)
+
+    def test_isvalid(self):
+        param = {"cache": self.path, "isvalid": "valid.xml"}
+        fout = io.StringIO()
+        xml2ddl.xtd(io.BytesIO(self.INPUT), fout, io.BytesIO(self.INPUT), param)
+
+        # Result for another file to validate against is not reused.
+        self.assertRaises(xml2ddl.XTDNotValid, xml2ddl.xtd,
+                          io.BytesIO(self.INPUT), io.StringIO(),
+                          io.BytesIO(b"<root><other/></root>"), param)
+
+    def test_no_cache(self):
+        with unittest.mock.patch.object(xml2ddl, "cache_dir",
+                                        return_value = self.path):
+            output = self.run_xtd({})
+            files = sorted(os.listdir(self.path))
+            self.assertEqual(len(files), 2)
+
+            with unittest.mock.patch.object(xml2ddl, "xtd_database",
+                                            wraps = xml2ddl.xtd_database) \
+                    as xtd_database:
+                self.assertEqual(self.run_xtd({"no-cache": "no-cache"}),
+                                 output)
+                self.assertEqual(xtd_database.call_count, 1)
+
+            self.assertEqual(sorted(os.listdir(self.path)), files)
+
+    def test_lru(self):
+        cache = xml2ddl.Cache(self.path)
+        keys = [str(num) * 64 for num in range(4)]
+        for num, key in enumerate(keys):
+            cache.put(key, "x" * 100)
+            os.utime(os.path.join(self.path, key), (num, num))
+
+        # Result read last is used most recently.
+        self.assertEqual(cache.get(keys[0]), "x" * 100)
+
+        # Cache of 300 bytes keeps 225 bytes after eviction.
+        xml2ddl.Cache(self.path, size = 300).evict()
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         sorted([keys[0], keys[3], xml2ddl.CACHE_INDEX]))
+        with open(os.path.join(self.path, xml2ddl.CACHE_INDEX)) as fin:
+            self.assertEqual(fin.read(), "200")
+
+    def test_foreign_files(self):
+        for name in ("notes.txt", "thesis.tex", "A" * 64, "0" * 63, "0" * 65):
+            with open(os.path.join(self.path, name), "w") as fout:
+                fout.write("x" * 100)
+
+        cache = xml2ddl.Cache(self.path, size = 10)
+        key = "0" * 64
+        cache.put(key, "y" * 100)
+        cache.evict()
+
+        self.assertEqual(sorted(os.listdir(self.path)),
+                         sorted(["notes.txt", "thesis.tex", "A" * 64, "0" * 63,
+                                 "0" * 65, xml2ddl.CACHE_INDEX]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,12 +4,11 @@
 # XML to DDL converter
 # 2012 Fridolin Pokorny <fridex.devel@gmail.com>
 
-import getopt
+# Only modules which are already loaded by interpreter are imported here.
+# Others are imported where needed to keep startup fast, see bench_startup.py.
+import os
 import sys
 import io
-import re
-import xml.etree.ElementTree as etree
-import xml.parsers.expat as parsers
 
 # Exception used if arguments are not correct.
 class XTDCheckArgument(Exception):
@@ -23,6 +22,10 @@ class XTDIError(Exception):
 class XTDOError(Exception):
     pass
 
+# Exception used if input file is not well-formed XML.
+class XTDParseError(Exception):
+    pass
+
 # Exception used if database generated from isvalid is not valid.
 class XTDNotValid(Exception):
     pass
@@ -32,6 +35,58 @@ class XTDNotValid(Exception):
 class XTDNameError(Exception):
     pass
 
+# Exception used if configured limit of resources was exceeded.
+class XTDLimitError(Exception):
+    pass
+
+# Version of cached results, bump if output format changes.
+CACHE_VERSION = "1"
+
+# Default maximum size of cache directory in bytes.
+CACHE_SIZE = 64 * 1024 * 1024
+
+# Length of keys of stored results, only files named by a key are evicted.
+CACHE_KEY_LENGTH = 64
+
+# Name of file in cache directory with estimated size of stored results.
+CACHE_INDEX = "size"
+
+# Part of cache size kept after eviction, so it is not needed on every store.
+CACHE_KEEP = 0.75
+
+# Size of input, which can not be rewound, kept in memory while computing cache
+# key in bytes. Rest of the input is written to a temporary file.
+CACHE_SPOOL = 1024 * 1024
+
+# Parameters which affect output and thus cache key.
+CACHE_PARAMS = ("etc", "a", "b", "g", "header", "dialect")
+
+# SQL dialects, each maps data types of columns to data types of the dialect.
+# New dialect can be added by adding its mapping.
+DIALECTS = {
+    "mssql":      {"BIT": "BIT", "INT": "INT", "FLOAT": "FLOAT",
+                   "NVARCHAR": "NVARCHAR", "NTEXT": "NTEXT"},
+    "postgresql": {"BIT": "BOOLEAN", "INT": "INTEGER",
+                   "FLOAT": "DOUBLE PRECISION", "NVARCHAR": "VARCHAR",
+                   "NTEXT": "TEXT"},
+    "sqlite":     {"BIT": "INTEGER", "INT": "INTEGER", "FLOAT": "REAL",
+                   "NVARCHAR": "TEXT", "NTEXT": "TEXT"},
+    "mysql":      {"BIT": "BIT", "INT": "INT", "FLOAT": "DOUBLE",
+                   "NVARCHAR": "TEXT", "NTEXT": "LONGTEXT"},
+}
+
+# Dialect used if none is specified.
+DEFAULT_DIALECT = "mssql"
+
+# Size of chunks read from input files in bytes.
+PARSE_CHUNK = 64 * 1024
+
+# Number of elements processed between checks of time and resources.
+CHECK_ELEMENTS = 4096
+
+# Number of values buffered per column before their data type is determinated.
+VALUE_BATCH = 512
+
 ################################################################################
 # Database class basic operations.
 class Database:
@@ -39,33 +94,58 @@ class Database:
     # @param - etc option from command line
     # @param - enable duplicit tables
     # @param - do not generate columns from attributes
+    # @param - maximum number of tables, 0 for no limit
     # @return - none
-    def __init__(self, etc = -1, duplicity = 0, no_columns = 0):
+    def __init__(self, etc = -1, duplicity = 0, no_columns = 0,
+                 max_tables = 0):
         self.__etc          = etc
         self.__duplicity    = duplicity
         self.__entries      = {}
         self.__no_columns   = no_columns
+        self.__max_tables   = max_tables
         self.__relations    = {}
+        # Reference count of every relation in __relations.
+        self.__links        = {}
+        # Relations added to __relations by flush of the table.
+        self.__flushed      = {}
+        # Tables which have relation to the table.
+        self.__referrers    = {}
+        # Tables which need to be flushed again.
+        self.__dirty        = set([])
+
+    # Get table by name. If table does not exist it is created.
+    # @param - name of the table
+    # @return - table
+    def __table(self, name):
+        if name not in self.__entries:
+            if self.__max_tables and len(self.__entries) >= self.__max_tables:
+                raise XTDLimitError("Number of tables exceeds "
+                                    + str(self.__max_tables) + "!")
+
+            self.__entries[name] = Table(name)
+            self.__relations[name] = set([])
+
+        return self.__entries[name]
 
     # Update relations in table by name.
     # @param - name of the table to update relations
     # @param - dict with table name and relation count
     # @return - none
     def update_relations(self, name, relations):
-        if name not in self.__entries:
-            self.__entries[name] = Table(name)
+        self.__table(name).update_relations(relations)
+
+        for rel in relations:
+            self.__referrers.setdefault(rel, set([])).add(name)
 
-        self.__entries[name].update_relations(relations)
+        if relations:
+            self.__dirty.add(name)
 
     # Update type in value in value column.
     # @param - name of table in database
     # @param - data in value column to determinate data type
     # @return - none
     def update_value(self, name, data):
-        if name not in self.__entries:
-            self.__entries[name] = Table(name)
-
-        self.__entries[name].update_value(data)
+        self.__table(name).update_value(data)
 
     # Get columns of given table.
     # @param - table name to get columns from
@@ -107,78 +187,118 @@ class Database:
     # @return - none
     def update_attribute(self, name, attribute, data):
         if not self.__no_columns:
-            if name not in self.__entries:
-                self.__entries[name] = Table(name)
+            table = self.__table(name)
+            known = table.has_column(attribute)
 
-            self.__entries[name].update_attribute(attribute, data)
+            table.update_attribute(attribute, data)
 
-    # Update database structure before print. Tables from relations are created.
-    # @param - none
-    # @return - none
-    def flush(self):
-        self.__relations = {}
+            # New column can collide with keys of the table and of tables
+            # referencing it, check them again.
+            if not known and table.has_column(attribute):
+                self.__dirty.add(name)
+                self.__dirty.update(self.__referrers.get(name, ()))
 
-        for table in self.__entries.values():
-            self.__relations[table.name()] = set([])
+    # Add relation between tables to __relations.
+    # @param - table holding the relation
+    # @param - table the relation points to
+    # @return - none
+    def __link(self, owner, target):
+        self.__links[(owner, target)] = self.__links.get((owner, target), 0) + 1
+        self.__relations[owner].add(target)
 
-        for table in self.__entries.values():
-            for name, count in table.relations().items():
-                if self.__duplicity:
-                    if name in table.columns().keys():
+    # Remove relation between tables added by __link().
+    # @param - table holding the relation
+    # @param - table the relation points to
+    # @return - none
+    def __unlink(self, owner, target):
+        self.__links[(owner, target)] -= 1
+        if not self.__links[(owner, target)]:
+            del self.__links[(owner, target)]
+            self.__relations[owner].discard(target)
+
+    # Create keys for relations of one table.
+    # @param - table to be flushed
+    # @return - list of relations as (owner, target) tuples
+    def __flush_table(self, table):
+        links = []
+
+        for name, count in table.relations().items():
+            if self.__duplicity:
+                if table.has_column(name):
+                    raise XTDNameError
+
+                # Get only one i_item with highest ranking of datatype.
+                table.set_key(name)
+                # Store info for XML generation.
+                links.append((table.name(), name))
+
+            elif self.__etc != -1 and count > self.__etc:
+                # Maximum in-table reference reached.
+                # Create records in table.
+                ref = self.__table(name)
+                if ref.has_column(name):
+                    raise XTDNameError
+
+                ref.set_key(table.name())
+                links.append((name, table.name()))
+
+            else:
+                # Maximum in-table reference not reached.
+                # create records in subtable
+                if count == 1:
+                    if table.has_column(name):
                         raise XTDNameError
 
-                    # Get only one i_item with highest ranking of datatype.
                     table.set_key(name)
-                    # Store info for XML generation.
-                    self.__relations[table.name()].add(name)
-
-                elif self.__etc != -1 and count > self.__etc:
-                    if name in self.__entries[name].columns().keys():
-                        raise XTDNameError
+                else:
+                    table.set_keys(name, count)
+                links.append((table.name(), name))
 
-                    # Maximum in-table reference reached.
-                    # Create records in table.
-                    if name not in self.__entries:
-                        self.__entries[name] = Table(name)
+        return links
 
-                    self.__entries[name].set_key(table.name())
-                    self.__relations[name].add(table.name())
+    # Update database structure before print. Tables from relations are created.
+    # Only tables changed since last flush are updated.
+    # @param - none
+    # @return - none
+    def flush(self):
+        if not self.__dirty:
+            return
 
-                else:
-                    # Maximum in-table reference not reached.
-                    # create records in subtable
-                    if count == 1:
-                        if name in table.columns().keys():
-                            raise XTDNameError
+        # Keep order of tables so keys are created in the same order.
+        for table in [table for table in self.__entries.values()
+                      if table.name() in self.__dirty]:
+            links = self.__flush_table(table)
 
-                        table.set_key(name)
-                    else:
-                        for num in range(count):
-                            if (name + str(num  + 1)) in table.columns().keys():
-                                raise XTDNameError
+            for owner, target in self.__flushed.get(table.name(), ()):
+                self.__unlink(owner, target)
+            for owner, target in links:
+                self.__link(owner, target)
 
-                            table.set_key(name + str(num + 1))
-                    self.__relations[table.name()].add(name)
+            self.__flushed[table.name()] = links
+            self.__dirty.discard(table.name())
 
     # Print database structure in DDL format.
     # @param - output file to print to
+    # @param - SQL dialect to use, see DIALECTS
     # @return - none
-    def print_ddl(self, fout):
+    def print_ddl(self, fout, dialect = DEFAULT_DIALECT):
         self.flush()
+        types = DIALECTS[dialect]
 
         for table in self.__entries.values():
             fout.write("CREATE TABLE " + table.name() + "("
-                       + "\n   prk_" + table.name() + "_id" + " INT PRIMARY KEY")
+                       + "\n   prk_" + table.name() + "_id " + types["INT"]
+                       + " PRIMARY KEY")
             # Print foreign keys.
             for key in table.keys():
-                fout.write(",\n   " + key + " INT")
+                fout.write(",\n   " + key + " " + types["INT"])
             # Print columns and their data types.
             for column, data_type in table.columns().items():
-                fout.write(",\n   " + column + " " + data_type)
+                fout.write(",\n   " + column + " " + types[data_type])
             # Print value, if any.
             data_type = table.value()
             if data_type != None:
-                fout.write(",\n   value " + data_type)
+                fout.write(",\n   value " + types[data_type])
 
             fout.write("\n);\n\n")
 
@@ -400,6 +520,15 @@ class Table:
         self.__keys      = {}
         self.__refs      = {}
         self.__value     = None
+        # Values of columns waiting for get_batch_data_type(), see flush().
+        self.__pending   = {}
+        # Last value of value field waiting for get_data_type().
+        self.__pending_value = None
+        # Lowest number N for column names in form PREFIX + N, see
+        # index_column().
+        self.__numbered  = {}
+        # The same for column names in form PREFIX + N + "_id".
+        self.__numbered_keys = {}
 
     # Getter for name.
     # @param - none
@@ -411,8 +540,15 @@ class Table:
     # @param - none
     # @return - dict with column name as a key and data type as a value
     def columns(self):
+        self.flush()
         return self.__columns
 
+    # Check whether column exists.
+    # @param - column name
+    # @return - True if column exists, otherwise False
+    def has_column(self, column):
+        return column in self.__columns
+
     # Getter for relations.
     # @param - none
     # @return - dict with name of the table as a key and reference count as a
@@ -436,6 +572,7 @@ class Table:
     # @param - none
     # @return - None if value is not set, otherwise data type of value
     def value(self):
+        self.flush()
         return self.__value
 
     # Update relations in table.
@@ -460,8 +597,36 @@ class Table:
             if column == "prk_" + self.name() + "_id":
                 raise XTDNameError # Cannot add atribute with same name as PRK!
 
-            self.__columns[column] = get_data_type(data,
-                                               self.__columns.get(column, "BIT"))
+            if column not in self.__columns:
+                self.index_column(column)
+                # Keep order of columns, data type is set on flush.
+                self.__columns[column] = "BIT"
+
+            pending = self.__pending.setdefault(column, [])
+            pending.append(data)
+            if len(pending) >= VALUE_BATCH:
+                self.__columns[column] = get_batch_data_type(pending,
+                                                       self.__columns[column])
+                del self.__pending[column]
+
+    # Remember numbered column name, so collisions with numbered keys created
+    # by set_keys() can be checked without trying every number.
+    # @param - column name
+    # @return - none
+    def index_column(self, column):
+        if column.endswith("_id"):
+            index = self.__numbered_keys
+            column = column[:-3]
+        else:
+            index = self.__numbered
+
+        pos = len(column)
+        while pos > 1 and column[pos - 1] in "0123456789":
+            pos -= 1
+            if column[pos] != "0":
+                num = int(column[pos:])
+                prefix = column[:pos]
+                index[prefix] = min(index.get(prefix, num), num)
 
     def set_key(self, ref):
         fkname = ref + "_id"
@@ -470,13 +635,272 @@ class Table:
 
         self.__keys[fkname] = "INT"
 
+    # Set keys ref1_id up to refN_id for N references to the same table.
+    # @param - referenced table
+    # @param - reference count
+    # @return - none
+    def set_keys(self, ref, count):
+        # There is column refI or refI_id with I from 1 to count.
+        if self.__numbered.get(ref, count + 1) <= count \
+                or self.__numbered_keys.get(ref, count + 1) <= count:
+            raise XTDNameError
+
+        for num in range(count):
+            self.__keys[ref + str(num + 1) + "_id"] = "INT"
+
     # Update value column in the table and get data type for record. If column
     # does not exist, it is created.
     # @oaram - value data to determinate data type
     # @return - none
     def update_value(self, data):
-        self.__value = get_data_type(data,
-                                     self.__columns.get("value", "BIT"), 1)
+        # Data type of value field depends on the last value only.
+        self.__pending_value = data
+
+    # Determinate data types of buffered values. Called by getters, so data
+    # types are always up to date when read.
+    # @param - none
+    # @return - none
+    def flush(self):
+        if self.__pending:
+            for column, pending in self.__pending.items():
+                self.__columns[column] = get_batch_data_type(pending,
+                                                       self.__columns[column])
+            self.__pending = {}
+
+        if self.__pending_value is not None:
+            self.__value = get_data_type(self.__pending_value,
+                                         self.__columns.get("value", "BIT"), 1)
+            self.__pending_value = None
+
+################################################################################
+# Cache class to store results of previous conversions on disk.
+class Cache:
+    """Cache class to store XTD results keyed by content hash."""
+    # Constructor.
+    # @param - directory to store results in
+    # @param - maximum size of all stored results in bytes
+    def __init__(self, path, size = CACHE_SIZE):
+        self.__path = path
+        self.__size = size
+
+    # Compute digest of input. Seekable input is read in chunks and rewound to
+    # the position it was read from. Other input is copied to a temporary file
+    # while it is read, so it can be parsed then without holding it in memory.
+    # @param - input file opened in binary mode
+    # @return - digest as bytes and file to read the input from
+    def digest(self, fin):
+        import hashlib
+
+        content = hashlib.sha256()
+        if fin.seekable():
+            pos = fin.tell()
+            for chunk in iter(lambda: fin.read(PARSE_CHUNK), b""):
+                content.update(chunk)
+            fin.seek(pos)
+        else:
+            import tempfile
+
+            fspool = tempfile.SpooledTemporaryFile(max_size = CACHE_SPOOL)
+            for chunk in iter(lambda: fin.read(PARSE_CHUNK), b""):
+                content.update(chunk)
+                fspool.write(chunk)
+            fspool.seek(0)
+            fin = fspool
+
+        return content.digest(), fin
+
+    # Compute key for given input digests and parameters.
+    # @param - list of digests of inputs, see digest()
+    # @param - cmd-line parameters as a dict
+    # @return - key as a hex string
+    def key(self, digests, param):
+        import hashlib
+
+        digest = hashlib.sha256()
+        digest.update(CACHE_VERSION.encode("utf-8"))
+        digest.update(repr(sorted((name, param[name]) for name in CACHE_PARAMS
+                                  if name in param)).encode("utf-8"))
+        for content in digests:
+            digest.update(content)
+
+        return digest.hexdigest()
+
+    # Check if given name is a key of stored result, see key().
+    # @param - name of file in cache directory
+    # @return - True if it is a key, otherwise False
+    def is_key(self, name):
+        return len(name) == CACHE_KEY_LENGTH \
+               and all(char in "0123456789abcdef" for char in name)
+
+    # Get stored result. Access time of the result is updated for LRU.
+    # @param - key of the result
+    # @return - None if there is no result, otherwise result
+    def get(self, key):
+        fname = os.path.join(self.__path, key)
+        try:
+            with io.open(fname, 'r', encoding='utf-8') as fcache:
+                result = fcache.read()
+            os.utime(fname, None)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return result
+
+    # Write file atomically, so other processes never see it half written.
+    # @param - name of the file
+    # @param - content of the file
+    # @return - none
+    def __write(self, fname, content):
+        ftemp = fname + "." + str(os.getpid()) + ".tmp"
+        try:
+            with io.open(ftemp, 'w', encoding='utf-8') as fcache:
+                fcache.write(content)
+            os.replace(ftemp, fname)
+        except (IOError, OSError):
+            try:
+                os.remove(ftemp)
+            except OSError:
+                pass
+            raise
+
+    # Store result, oldest results are removed if cache is full. Failure to
+    # store result is not an error.
+    # @param - key of the result
+    # @param - result to be stored
+    # @return - none
+    def put(self, key, result):
+        fname = os.path.join(self.__path, key)
+        try:
+            os.makedirs(self.__path, exist_ok = True)
+            self.__write(fname, result)
+
+            # Cache directory is scanned only if it can be full.
+            total = self.account(os.stat(fname).st_size)
+            if total is None or total > self.__size:
+                self.evict()
+        except (IOError, OSError):
+            pass
+
+    # Add size of stored result to estimated size of the cache. The estimate
+    # can be off if more processes store results at once, evict() corrects it.
+    # @param - size of stored result in bytes
+    # @return - estimated size of the cache in bytes, None if it is unknown
+    def account(self, size):
+        findex = os.path.join(self.__path, CACHE_INDEX)
+        try:
+            with io.open(findex, 'r', encoding='utf-8') as fcache:
+                total = int(fcache.read()) + size
+        except (IOError, OSError, ValueError):
+            return None
+
+        self.__write(findex, str(total))
+        return total
+
+    # Remove least recently used results until cache fits CACHE_KEEP part of
+    # its size and store actual size of the cache as its estimate.
+    # @param - none
+    # @return - none
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.__path):
+            # Skip files which are not results, the directory can be shared
+            # with other files, and results being written by other processes.
+            if not self.is_key(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.__path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total += stat.st_size
+
+        entries.sort()
+        for mtime, size, name in entries:
+            if total <= self.__size * CACHE_KEEP:
+                break
+            try:
+                os.remove(os.path.join(self.__path, name))
+            except OSError:
+                pass
+            total -= size
+
+        self.__write(os.path.join(self.__path, CACHE_INDEX), str(total))
+
+################################################################################
+# Get default cache directory.
+# @param - none
+# @return - path to cache directory
+def cache_dir():
+    base = os.environ.get("XDG_CACHE_HOME") \
+           or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "xml2ddl")
+
+################################################################################
+# Compiled patterns for BIT, INT and FLOAT data, see data_type_patterns().
+DATA_TYPE_PATTERNS = None
+
+# Compile patterns used to determinate data type on first use.
+# @param - none
+# @return - tuple with BIT, INT and FLOAT pattern
+def data_type_patterns():
+    global DATA_TYPE_PATTERNS
+
+    if DATA_TYPE_PATTERNS is None:
+        import re
+
+        DATA_TYPE_PATTERNS = (
+            re.compile("(^1$)|(^0$)|(^True$)|(^False$)"),
+            re.compile("^[0-9]+$"),
+            re.compile("^[-+]?\\d*\\.?\\d+((e|E)[-+]?\\d+)?$"))
+
+    return DATA_TYPE_PATTERNS
+
+################################################################################
+# Compiled pattern for values joined by NUL, see data_batch_pattern().
+DATA_BATCH_PATTERN = None
+
+# Compile pattern used to determinate data type of many values at once. The
+# pattern matches every value which data_type_patterns() would classify as BIT,
+# INT or FLOAT (or which is empty) and captures it in the group of the type.
+# Other values are not matched. Trailing newline is allowed as "$" does.
+# @param - none
+# @return - pattern
+def data_batch_pattern():
+    global DATA_BATCH_PATTERN
+
+    if DATA_BATCH_PATTERN is None:
+        import re
+
+        DATA_BATCH_PATTERN = re.compile(
+            "(?<![^\\0])"
+            "(?:(1|0|True|False)\\n?"
+            "|([0-9]+)\\n?"
+            "|([-+]?\\d*\\.?\\d+(?:[eE][-+]?\\d+)?)\\n?"
+            "|)"
+            "(?![^\\0])")
+
+    return DATA_BATCH_PATTERN
+
+################################################################################
+# Merge data type of new data into previous data type.
+# @param - previous data type
+# @param - data type of new data
+# @return - resulting data type
+def merge_data_type(data_type, indata_type):
+    if data_type == "BIT":
+        return indata_type
+    elif data_type == "INT" and indata_type == "BIT" or indata_type == "INT":
+        return data_type
+    elif data_type == "FLOAT" \
+       and indata_type == "BIT" or indata_type == "INT" or indata_type == "FLOAT":
+        return data_type
+    elif data_type == "NVARCHAR" and indata_type != "NTEXT":
+        return data_type
+    elif data_type == "NTEXT":
+        return data_type
+    else:
+        return indata_type
 
 ################################################################################
 # Determinate data type by data value and previous data type.
@@ -484,32 +908,57 @@ class Table:
 # @param - previous data type
 # @param - 1 if generating value, otherwise 0
 def get_data_type(data, data_type = "BIT", value = 0):
+    bit, integer, real = DATA_TYPE_PATTERNS or data_type_patterns()
+
     if data == "":
         indata_type = "BIT"
-    elif re.search("(^1$)|(^0$)|(^True$)|(^False$)", data):
+    elif bit.search(data):
         indata_type = "BIT"
-    elif re.search("^[0-9]+$", data):
+    elif integer.search(data):
         indata_type = "INT"
-    elif re.search("^[-+]?\d*\.?\d+((e|E)[-+]?\d+)?$", data):
+    elif real.search(data):
         indata_type = "FLOAT"
     elif not value:
         indata_type = "NVARCHAR"
     else:
         indata_type = "NTEXT"
 
-    if data_type == "BIT":
-        return indata_type
-    elif data_type == "INT" and indata_type == "BIT" or indata_type == "INT":
-        return data_type
-    elif data_type == "FLOAT" \
-       and indata_type == "BIT" or indata_type == "INT" or indata_type == "FLOAT":
-        return data_type
-    elif data_type == "NVARCHAR" and indata_type != "NTEXT":
-        return data_type
-    elif data_type == "NTEXT":
+    return merge_data_type(data_type, indata_type)
+
+################################################################################
+# Determinate data type by list of data values and previous data type. Result
+# is the same as of calling get_data_type() for every value in order.
+# @param - list of data which column holds
+# @param - previous data type
+# @param - 1 if generating value, otherwise 0
+def get_batch_data_type(data, data_type = "BIT", value = 0):
+    joined = "\0".join(data)
+    if joined.count("\0") != len(data) - 1:
+        # NUL inside of data, cannot be split.
+        for item in data:
+            data_type = get_data_type(item, data_type, value)
         return data_type
-    else:
-        return indata_type
+
+    matches = (DATA_BATCH_PATTERN or data_batch_pattern()).findall(joined)
+
+    # Once data type is not BIT, other BIT, INT and FLOAT data do not change it,
+    # only strings do. So only the first INT or FLOAT matters.
+    for bit, integer, real in matches:
+        if integer:
+            data_type = merge_data_type(data_type, "INT")
+            break
+        elif real:
+            data_type = merge_data_type(data_type, "FLOAT")
+            break
+
+    # Some data were not matched, there is a string.
+    if len(matches) < len(data):
+        if not value:
+            data_type = merge_data_type(data_type, "NVARCHAR")
+        else:
+            data_type = merge_data_type(data_type, "NTEXT")
+
+    return data_type
 
 ################################################################################
 # Check if data2 can be stored in data1.
@@ -554,67 +1003,270 @@ def data_type_usable(data1, data2):
     return 1
 
 ################################################################################
-# Recursively browse xml document and update entries in database.
-# @param - relative root item to start with
+# Monitor class to report progress of long runs and to guard resources.
+class Monitor:
+    """Monitor class to report progress and guard resources of XTD."""
+    # Constructor.
+    # @param - seconds between progress reports, 0 for no reports
+    # @param - maximum resident set size in MB, 0 for no limit
+    # @param - maximum nesting depth of elements, 0 for no limit
+    # @param - output file to report to
+    def __init__(self, interval = 0, max_rss = 0, max_depth = 0,
+                 fout = sys.stderr):
+        import time
+
+        self.__time      = time.time
+        self.__interval  = interval
+        self.__max_rss   = max_rss
+        self.__max_depth = max_depth
+        self.__fout      = fout
+        self.__bytes     = 0
+        self.__elements  = 0
+        self.__check     = CHECK_ELEMENTS
+        self.__start     = self.__time()
+        self.__report    = self.__start + interval
+        self.__getrusage = None
+
+        if max_rss:
+            try:
+                import resource
+            except ImportError:
+                raise XTDCheckArgument("--max-rss is not supported on this "
+                                       "platform!")
+            self.__getrusage = resource.getrusage
+            self.__rusage_self = resource.RUSAGE_SELF
+
+    # Account chunk of input passed to the parser.
+    # @param - chunk of input
+    # @param - database being built, if any
+    # @return - none
+    def read(self, chunk, db = None):
+        self.__bytes += len(chunk)
+        self.check(db)
+
+    # Account processed element.
+    # @param - nesting depth of the element
+    # @param - database being built
+    # @return - none
+    def element(self, depth, db):
+        if self.__max_depth and depth > self.__max_depth:
+            raise XTDLimitError("Nesting depth exceeds "
+                                + str(self.__max_depth) + "!")
+
+        self.__elements += 1
+        if self.__elements >= self.__check:
+            self.__check += CHECK_ELEMENTS
+            self.check(db)
+
+    # Check resources and print progress if it is time to.
+    # @param - database being built, if any
+    # @return - none
+    def check(self, db = None):
+        if self.__getrusage is not None:
+            rss = self.__getrusage(self.__rusage_self).ru_maxrss
+            if sys.platform != "darwin":
+                rss *= 1024     # Linux reports KB, macOS bytes.
+            if rss > self.__max_rss * 1024 * 1024:
+                raise XTDLimitError("Resident set size exceeds "
+                                    + str(self.__max_rss) + " MB!")
+
+        if self.__interval and self.__time() >= self.__report:
+            self.report(db)
+            self.__report = self.__time() + self.__interval
+
+    # Print progress.
+    # @param - database being built, if any
+    # @return - none
+    def report(self, db = None):
+        if not self.__interval:
+            return
+
+        elapsed = max(self.__time() - self.__start, 1e-6)
+        tables = 0
+        columns = 0
+        if db is not None:
+            tables = len(db.entries())
+            columns = sum(len(table.columns())
+                          for table in db.entries().values())
+
+        print("xml2ddl: %.1f MB read, %d elements, %d tables, %d columns, "
+              "%.1f MB/s, %d elements/s"
+              % (self.__bytes / 1048576.0, self.__elements, tables, columns,
+                 self.__bytes / 1048576.0 / elapsed,
+                 self.__elements / elapsed), file=self.__fout)
+
+################################################################################
+# Update value of the item in database. Text of the item is complete when its
+# first child or its end is parsed.
+# @param - open item as [element, tag, relations, 1 if value was updated]
 # @param - database to work with
 # @return - none
-def xtd_database(item, db):
-    info = {}
+def xtd_value(entry, db):
+    if not entry[3]:
+        entry[3] = 1
+        text = entry[0].text
+        if text and not text.isspace():
+            db.update_value(entry[1], text)
+
+################################################################################
+# Update entries in database by events from parser. Items are processed in the
+# same order as they would be by recursive walk of the whole document, every
+# item is removed from the document once it ends.
+# @param - list of (event, element) tuples
+# @param - database to work with
+# @param - monitor to account elements in, if any
+# @param - stack of open items, see xtd_value(), root element is the first
+# @return - none
+def xtd_events(events, db, monitor, stack):
+    for event, item in events:
+        if event == "start":
+            tag = item.tag.lower()
+
+            # Root element itself is not stored.
+            if stack:
+                if len(stack) > 1:
+                    parent = stack[-1]
+                    xtd_value(parent, db)
+                    # Rememeber relations
+                    parent[2][tag] = parent[2].get(tag, 0) + 1
+
+                if monitor is not None:
+                    monitor.element(len(stack), db)
 
-    # Remember columns
-    for cname, data in item.items():
-        db.update_attribute(item.tag.lower(), cname.lower(), data)
+                # Remember columns
+                for cname, data in item.items():
+                    db.update_attribute(tag, cname.lower(), data)
 
-    # Update value
-    if item.text and not item.text.isspace():
-        db.update_value(item.tag.lower(), item.text)
+            stack.append([item, tag, {}, 0])
 
-        # Rememeber elations
-    for child in item.getchildren():
-        info[child.tag.lower()] = info.get(child.tag.lower(), 0) + 1
+        else:
+            entry = stack.pop()
+            if stack:
+                xtd_value(entry, db)
+                db.update_relations(entry[1], entry[2])
+                stack[-1][0].remove(item)
+
+################################################################################
+# Parse xml document and update entries in database while it is being read.
+# Document is never held in memory as a whole.
+# @param - input file opened in binary mode
+# @param - database to work with
+# @param - monitor to account read input and elements in, if any
+# @return - none
+def xtd_database(fin, db, monitor = None):
+    import xml.etree.ElementTree as etree
+    import xml.parsers.expat as parsers
+
+    stack = []
+    try:
+        parser = etree.XMLPullParser(events = ("start", "end"))
+        for chunk in iter(lambda: fin.read(PARSE_CHUNK), b""):
+            parser.feed(chunk)
+            if monitor is not None:
+                monitor.read(chunk, db)
+            xtd_events(parser.read_events(), db, monitor, stack)
+
+        parser.close()
+        xtd_events(parser.read_events(), db, monitor, stack)
+    except (etree.ParseError, parsers.ExpatError) as err:
+        raise XTDParseError(err)
+
+################################################################################
+# Print database to string.
+# @param - database to print
+# @param - SQL dialect to print, None to print XML
+# @param - cmd-line parameters as a dict
+# @return - output as a string
+def xtd_output(db, dialect, param):
+    out = io.StringIO()
+    if "header" in param:
+        print("--", file=out, end="")
+        print(param["header"], file=out)
+        print("", file=out)
 
-        # Recursively look for children
-        xtd_database(child, db)
+    if dialect is None:
+        db.print_xmlrel(out)
+    else:
+        db.print_ddl(out, dialect)
 
-    db.update_relations(item.tag.lower(), info)
+    return out.getvalue()
 
 ################################################################################
-# Analyse input and if it is correct print asked output.
+# Analyse input and if it is correct print asked output. Input is analysed once
+# for all outputs.
+# @param - input file opened in binary mode
 # @param - output file to write to
+# @param - file to validate against opened in binary mode
 # @param - cmd-line parameters as a dict
+# @param - list of (dialect, file) tuples to write DDL in other dialects to
 # @return - none
-def xtd(fin, fout, fval, param):
+def xtd(fin, fout, fval, param, fdialects = ()):
     """Analyse input and make output for XTD."""
+
+    # Dialect written to output, None for XML.
+    if "g" in param:
+        dialect = None
+    else:
+        dialect = DEFAULT_DIALECT
+        for name, fname in param.get("dialect", {}).items():
+            if not fname:
+                dialect = name
+
+    outputs = [(dialect, fout)] + list(fdialects)
+    results = [None] * len(outputs)
+
+    # Reuse result of previous run on the same input and parameters.
+    cache = None
+    if "no-cache" not in param:
+        cache = Cache(param.get("cache", cache_dir()),
+                      param.get("cache-size", CACHE_SIZE))
+
+        # Input is read twice, to compute key and to parse it.
+        digest, fin = cache.digest(fin)
+        digests = [digest]
+        if "isvalid" in param:
+            digest, fval = cache.digest(fval)
+            digests.append(digest)
+
+        keys = [cache.key(digests, dict(param, dialect = name))
+                for name, ftarget in outputs]
+        results = [cache.get(key) for key in keys]
+
+    if None not in results:
+        for (name, ftarget), result in zip(outputs, results):
+            ftarget.write(result)
+        return
+
+    monitor = Monitor(interval = param.get("progress", 0),
+                      max_rss = param.get("max-rss", 0),
+                      max_depth = param.get("max-depth", 0))
+
     db = Database(etc = param.get("etc", -1),
                   duplicity = "b" in param,
-                  no_columns = "a" in param)
-    tree = etree.parse(fin)
-
-    for item in tree.getroot().getchildren():
-        xtd_database(item, db)
+                  no_columns = "a" in param,
+                  max_tables = param.get("max-tables", 0))
+    xtd_database(fin, db, monitor)
 
     # Bonus implementation.
     if "isvalid" in param:
         db2 = Database(etc = param.get("etc", -1),
                        duplicity = "b" in param,
-                       no_columns = "a" in param)
-        tree2 = etree.parse(fval)
-
-        for item in tree2.getroot().getchildren():
-            xtd_database(item, db2)
+                       no_columns = "a" in param,
+                       max_tables = param.get("max-tables", 0))
+        xtd_database(fval, db2, monitor)
 
         if not db.is_subset(db2):
             raise XTDNotValid
 
-    if "header" in param:
-        print("--", file=fout, end="")
-        print(param["header"], file=fout)
-        print("", file=fout)
+    monitor.report(db)
 
-    if "g" in param:
-        db.print_xmlrel(fout)
-    else:
-        db.print_ddl(fout)
+    for num, (name, ftarget) in enumerate(outputs):
+        if results[num] is None:
+            results[num] = xtd_output(db, name, param)
+            if cache is not None:
+                cache.put(keys[num], results[num])
+
+        ftarget.write(results[num])
 
 ################################################################################
 # Print warning msg on stderr if passed and print help
@@ -634,9 +1286,84 @@ def print_help(errmsg = ""):
     print("  -a                 do not generate columns");
     print("  -b                 ignore duplicity (do not use with --etc)");
     print("  -g                 generate XML file only");
+    print("  --dialect=NAME     generate DDL in SQL dialect NAME, one of");
+    print("                     " + ", ".join(sorted(DIALECTS)));
+    print("  --dialect=NAME=FILE");
+    print("                     write DDL in SQL dialect NAME to FILE as well,");
+    print("                     can be used more times");
+    print("  --progress=SEC     report progress on stderr every SEC seconds");
+    print("  --max-rss=MB       abort if memory usage exceeds MB megabytes");
+    print("  --max-tables=NUM   abort if there are more than NUM tables");
+    print("  --max-depth=NUM    abort if elements are nested deeper than NUM");
+    print("  --cache=DIR        store results in DIR (default: " + cache_dir()
+          + ")");
+    print("  --cache-size=NUM   keep up to NUM bytes of results in cache");
+    print("  --no-cache         do not use cached results");
     print("Fridolin Pokorny 2012 <fridex.devel@gmail.com>");
     print("Version: 0.1a");
 
+################################################################################
+# Split arguments to options and other arguments, the same way getopt.getopt()
+# does. Module getopt is not used as it imports gettext and re on startup.
+# @param - arguments to be processed
+# @param - short options, option followed by ':' requires argument
+# @param - list of long options, option followed by '=' requires argument
+# @return - list of (option, argument) pairs and list of remaining arguments
+def parse_opt(args, shortopts, longopts):
+    opts = []
+    while args and args[0].startswith("-") and args[0] != "-":
+        arg, args = args[0], args[1:]
+        if arg == "--":
+            break
+
+        if arg.startswith("--"):
+            option, sep, argument = arg[2:].partition("=")
+            matches = [o for o in longopts if o.startswith(option)]
+            if not matches:
+                raise XTDCheckArgument("option --" + option + " not recognized")
+            if option in matches:
+                has_arg = 0
+            elif option + "=" in matches:
+                has_arg = 1
+            elif len(matches) > 1:
+                raise XTDCheckArgument("option --" + option
+                                       + " not a unique prefix")
+            else:
+                has_arg = matches[0].endswith("=")
+                option = matches[0].rstrip("=")
+
+            if has_arg and not sep:
+                if not args:
+                    raise XTDCheckArgument("option --" + option
+                                           + " requires argument")
+                argument, args = args[0], args[1:]
+            elif not has_arg and sep:
+                raise XTDCheckArgument("option --" + option
+                                       + " must not have an argument")
+
+            opts.append(("--" + option, argument))
+        else:
+            arg = arg[1:]
+            while arg:
+                option, arg = arg[0], arg[1:]
+                pos = shortopts.find(option)
+                if option == ":" or pos == -1:
+                    raise XTDCheckArgument("option -" + option
+                                           + " not recognized")
+
+                argument = ""
+                if shortopts.startswith(":", pos + 1):
+                    if not arg:
+                        if not args:
+                            raise XTDCheckArgument("option -" + option
+                                                   + " requires argument")
+                        arg, args = args[0], args[1:]
+                    argument, arg = arg, ""
+
+                opts.append(("-" + option, argument))
+
+    return opts, args
+
 ################################################################################
 # Process arguments and check for necessary options.
 # @param - none
@@ -644,12 +1371,20 @@ def print_help(errmsg = ""):
 def check_opt():
     """Process arguments and check for necessary options."""
 
-    opts, args = getopt.getopt(sys.argv[1:], "abg", ["help",
-                                                     "isvalid=",
-                                                     "output=",
-                                                     "input=",
-                                                     "header=",
-                                                     "etc="])
+    opts, args = parse_opt(sys.argv[1:], "abg", ["help",
+                                                 "isvalid=",
+                                                 "output=",
+                                                 "input=",
+                                                 "header=",
+                                                 "etc=",
+                                                 "dialect=",
+                                                 "progress=",
+                                                 "max-rss=",
+                                                 "max-tables=",
+                                                 "max-depth=",
+                                                 "cache=",
+                                                 "cache-size=",
+                                                 "no-cache"])
     if args:
         raise XTDCheckArgument("Unknown option : ")
 
@@ -689,6 +1424,64 @@ def check_opt():
                 raise XTDCheckArgument("--etc and -b option not allowed at the "
                                     "same time!")
 
+        elif option == "--dialect":
+            name, sep, fname = argument.partition("=")
+            dialects = param.setdefault("dialect", {})
+
+            if name not in DIALECTS:
+                raise XTDCheckArgument("Unknown dialect " + name + "!")
+            if name in dialects:
+                raise XTDCheckArgument("Duplicit dialect " + name + "!")
+            if sep and not fname:
+                raise XTDCheckArgument("Missing file for dialect " + name + "!")
+            if not fname and "" in dialects.values():
+                raise XTDCheckArgument("Only one --dialect without file "
+                                       "allowed!")
+
+            dialects[name] = fname
+
+        elif option in ("--progress", "--max-rss", "--max-tables",
+                        "--max-depth"):
+            name = option[2:]
+            try:
+                if name not in param: param[name] = int(argument);
+                else: raise XTDCheckArgument("Duplicit argument " + option
+                                             + "!")
+            except ValueError:
+                    raise XTDCheckArgument("Please enter integer value for "
+                                           + option + "!")
+
+            if param[name] <= 0:
+                raise XTDCheckArgument("Non-positive " + option + "!")
+
+        elif option == "--cache":
+            if "cache" not in param: param["cache"] = argument;
+            else: raise XTDCheckArgument("Duplicit argument --cache!")
+
+            if "no-cache" in param:
+                raise XTDCheckArgument("--cache and --no-cache option not "
+                                    "allowed at the same time!")
+
+        elif option == "--cache-size":
+            try:
+                if "cache-size" not in param:
+                    param["cache-size"] = int(argument);
+                else: raise XTDCheckArgument("Duplicit argument --cache-size!")
+            except ValueError:
+                    raise XTDCheckArgument("Please enter integer value for "
+                                           "--cache-size!")
+
+            if param["cache-size"] < 0:
+                raise XTDCheckArgument("Negative --cache-size!")
+
+        elif option == "--no-cache":
+            if "no-cache" not in param: param["no-cache"] = "no-cache";
+            else: raise XTDCheckArgument("Duplicit argument --no-cache!")
+
+            if "cache" in param:
+                raise XTDCheckArgument("--no-cache and --cache option not "
+                                    "allowed at the same time!")
+
         elif option == "-a":
             if "a" not in param: param["a"] = "a";
             else: raise XTDCheckArgument("Duplicit argument -a!")
@@ -711,6 +1504,10 @@ def check_opt():
     if "help" in param and len(param) > 1:
         raise XTDCheckArgument("Help needed!")
 
+    if "g" in param and "" in param.get("dialect", {}).values():
+        raise XTDCheckArgument("-g and --dialect without file not allowed at "
+                               "the same time!")
+
     return param
 
 ################################################################################
@@ -723,8 +1520,8 @@ def main():
 
         if "help" not in param:
             try:
-                if "input" not in param: fin = sys.stdin
-                else: fin = io.open(param["input"], 'r', encoding='utf-8')
+                if "input" not in param: fin = sys.stdin.buffer
+                else: fin = io.open(param["input"], 'rb')
             except IOError as err:
                 raise XTDIError(err)
 
@@ -734,18 +1531,28 @@ def main():
             except IOError as err:
                 raise XTDOError(err)
 
+            fdialects = []
+            try:
+                for name, fname in param.get("dialect", {}).items():
+                    if fname:
+                        fdialects.append((name, io.open(fname, 'w',
+                                                        encoding='utf-8')))
+            except IOError as err:
+                raise XTDOError(err)
+
             try:
                 if "isvalid" in param:
-                    fval = io.open(param["isvalid"], 'r', encoding='utf-8')
+                    fval = io.open(param["isvalid"], 'rb')
                 else:
                     fval = {}
             except IOError as err:
                 raise XTDIError(err)
 
-            xtd(fin, fout, fval, param)
+            xtd(fin, fout, fval, param, fdialects)
 
-            if fin != sys.stdin: fin.close()
+            if fin != sys.stdin.buffer: fin.close()
             if fout != sys.stdout: fout.close()
+            for name, fdialect in fdialects: fdialect.close()
             if "isvalid" in param: fval.close()
 
         else:
@@ -755,10 +1562,6 @@ def main():
 
         return 0;
 
-    except getopt.GetoptError as exc:
-        print_help(exc)
-        sys.exit(1)
-
     except XTDCheckArgument as exc:
         print_help(exc)
         sys.exit(1)
@@ -771,11 +1574,11 @@ def main():
         print("Name collision!", file=sys.stderr)
         sys.exit(90)
 
-    except etree.ParseError:
-        print("Bad XML input file!\n", file=sys.stderr)
-        sys.exit(2)
+    except XTDLimitError as err:
+        print(err, file=sys.stderr)
+        sys.exit(92)
 
-    except parsers.ExpatError:
+    except XTDParseError:
         print("Bad XML input file!\n", file=sys.stderr)
         sys.exit(2)
 